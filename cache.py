@@ -0,0 +1,111 @@
+"""
+Cache Helper Functions
+
+Redis read-through cache for the per-client list endpoints.
+Caching is disabled (every lookup is a miss) when REDIS_URL is not set,
+and Redis errors are treated as misses so the database stays the source of truth.
+"""
+
+import os
+from typing import Optional, Tuple
+
+import orjson
+import redis.asyncio as redis
+from dotenv import load_dotenv
+
+# Load environment variables from .env file
+load_dotenv()
+
+CACHE_TTL_SECONDS = 60
+# Must outlive the slowest cache fill (a streamed response), see set_payload
+GENERATION_TTL_SECONDS = 86400
+# Keep these short: an unreachable Redis should fall back to Mongo quickly,
+# not wait out the OS TCP timeout on every request
+REDIS_TIMEOUT_SECONDS = 0.2
+# Streamed responses larger than this are served but not cached, so a
+# cache fill never holds more than this much of a response in memory
+CACHE_MAX_PAYLOAD_BYTES = 1024 * 1024
+
+_redis = None
+
+redis_url = os.getenv("REDIS_URL")
+
+def connect():
+    """Create the Redis client; call from the app's startup hook"""
+    global _redis
+    if redis_url:
+        _redis = redis.from_url(
+            redis_url,
+            socket_connect_timeout=REDIS_TIMEOUT_SECONDS,
+            socket_timeout=REDIS_TIMEOUT_SECONDS,
+        )
+    return _redis
+
+async def close():
+    """Close the Redis client; call from the app's shutdown hook"""
+    global _redis
+    if _redis is not None:
+        await _redis.aclose()
+    _redis = None
+
+def enabled() -> bool:
+    """Whether a Redis client is configured"""
+    return _redis is not None
+
+def client_key(collection_name: str, client_id: str, view: str = "all") -> str:
+    """Cache key for one client's documents in a collection"""
+    return f"{collection_name}:{view}:{client_id}"
+
+def _gen_key(key: str) -> str:
+    # bumped by every invalidate(); a fill only lands if it hasn't moved
+    return f"{key}:gen"
+
+async def get_cached(key: str) -> Tuple[Optional[bytes], Optional[bytes]]:
+    """Return (cached JSON payload or None on a miss, current generation)
+
+    Pass the generation back to set_cached/set_payload so a fill that raced
+    with a write doesn't overwrite the invalidation with stale data.
+    """
+    if _redis is None:
+        return None, None
+    try:
+        payload, generation = await _redis.mget(key, _gen_key(key))
+        return payload, generation
+    except redis.RedisError:
+        return None, None
+
+async def set_cached(key: str, docs, generation: Optional[bytes]) -> bytes:
+    """Serialize docs to JSON, cache them under key and return the payload"""
+    payload = orjson.dumps(docs)
+    await set_payload(key, payload, generation)
+    return payload
+
+async def set_payload(key: str, payload: bytes, generation: Optional[bytes]):
+    """Cache an already-serialized JSON payload, unless key was invalidated since generation was read"""
+    if _redis is None:
+        return
+    try:
+        async with _redis.pipeline(transaction=True) as pipe:
+            await pipe.watch(_gen_key(key))
+            if await pipe.get(_gen_key(key)) != generation:
+                return
+            pipe.multi()
+            pipe.set(key, payload, ex=CACHE_TTL_SECONDS)
+            await pipe.execute()
+    except redis.RedisError:
+        # includes WatchError: an invalidate landed between the check and the write
+        pass
+
+async def invalidate(*keys: str):
+    """Drop cached payloads after a write and bump their generations"""
+    if _redis is None or not keys:
+        return
+    try:
+        async with _redis.pipeline(transaction=True) as pipe:
+            pipe.delete(*keys)
+            for key in keys:
+                pipe.incr(_gen_key(key))
+                pipe.expire(_gen_key(key), GENERATION_TTL_SECONDS)
+            await pipe.execute()
+    except redis.RedisError:
+        pass
@@ -5,12 +5,18 @@ MongoDB helper functions ready to use in your backend code.
 Import and use these functions in your API endpoints for database operations.
 """
 
-from pymongo import MongoClient
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import WriteConcern
 from datetime import datetime, timezone
 import os
+import orjson
 from dotenv import load_dotenv
-from typing import Union
+from typing import List, Union
 from pydantic import BaseModel
+from pymongo.errors import BulkWriteError, PyMongoError
+import logging
+
+logger = logging.getLogger(__name__)
 
 # Load environment variables from .env file
 load_dotenv()
@@ -18,38 +24,146 @@ load_dotenv()
 _client = None
 db = None
 
+# Append-only logging collections: an ack from the primary is enough.
+# Everything else (payments, consents, ...) keeps the default write concern.
+FAST_WRITE_COLLECTIONS = ("measurement", "workoutlog", "nutritionentry")
+_fast_write = {}
+
 database_url = os.getenv("DATABASE_URL")
 database_name = os.getenv("DATABASE_NAME")
 
-if database_url and database_name:
-    _client = MongoClient(database_url)
-    db = _client[database_name]
+# Per worker process: the server holds WEB_CONCURRENCY times these, so size
+# them against the cluster's connection limit
+max_pool_size = int(os.getenv("MONGO_MAX_POOL_SIZE", 100))
+min_pool_size = int(os.getenv("MONGO_MIN_POOL_SIZE", 2))
+
+def connect():
+    """Create the pooled Motor client; call once from the app's startup hook"""
+    global _client, db
+    if database_url and database_name:
+        _client = AsyncIOMotorClient(database_url, maxPoolSize=max_pool_size, minPoolSize=min_pool_size, maxIdleTimeMS=30000)
+        db = _client[database_name]
+        for name in FAST_WRITE_COLLECTIONS:
+            _fast_write[name] = db.get_collection(name, write_concern=WriteConcern(w=1))
+    return db
+
+async def ensure_indexes():
+    """Create indexes for the per-client list queries; safe to re-run.
+    Failures are logged rather than raised so the app still starts without Mongo."""
+    if db is None:
+        return
+    try:
+        await _create_indexes()
+    except PyMongoError as e:
+        logger.warning("Index creation failed: %s", e)
+
+async def _create_indexes():
+    await db["measurement"].create_index([("client_id", 1), ("date", -1)])
+    await db["session"].create_index([("client_id", 1), ("start_time", -1)])
+    await db["workoutlog"].create_index([("client_id", 1), ("date", -1)])
+    await db["nutritionentry"].create_index([("client_id", 1), ("date", -1)])
+    await db["payment"].create_index([("client_id", 1), ("start_date", -1)])
+    # narrows the relative-strength progress scan to matching measurements;
+    # the projected fields aren't in the key, so documents are still fetched
+    await db["measurement"].create_index(
+        [("client_id", 1)],
+        partialFilterExpression={"one_rm_kg": {"$gt": 0}, "bodyweight_kg": {"$gt": 0}},
+    )
+
+def close():
+    """Close the Motor client; call from the app's shutdown hook"""
+    global _client, db
+    if _client is not None:
+        _client.close()
+    _client = None
+    db = None
+    _fast_write.clear()
+
+def _write_collection(collection_name: str):
+    """Collection handle to insert into, with its write concern applied"""
+    coll = _fast_write.get(collection_name)
+    return coll if coll is not None else db[collection_name]
 
 # Helper functions for common database operations
-def create_document(collection_name: str, data: Union[BaseModel, dict]):
+async def create_document(collection_name: str, data: Union[BaseModel, dict]):
     """Insert a single document with timestamp"""
     if db is None:
         raise Exception("Database not available. Check DATABASE_URL and DATABASE_NAME environment variables.")
 
-    # Convert Pydantic model to dict if needed
+    # Convert Pydantic model to dict if needed; unset optional fields are
+    # None, so skip them rather than storing a run of nulls. Defaults like
+    # Session.status are kept since queries and updates rely on them.
     if isinstance(data, BaseModel):
-        data_dict = data.model_dump()
+        data_dict = data.model_dump(exclude_none=True)
     else:
+        # insert_one adds _id to the dict it is given; don't mutate the caller's
         data_dict = data.copy()
 
-    data_dict['created_at'] = datetime.now(timezone.utc)
-    data_dict['updated_at'] = datetime.now(timezone.utc)
+    now = datetime.now(timezone.utc)
+    data_dict['created_at'] = now
+    data_dict['updated_at'] = now
 
-    result = db[collection_name].insert_one(data_dict)
+    result = await _write_collection(collection_name).insert_one(data_dict)
     return str(result.inserted_id)
 
-def get_documents(collection_name: str, filter_dict: dict = None, limit: int = None):
-    """Get documents from collection"""
+async def create_documents(collection_name: str, items: List[Union[BaseModel, dict]]):
+    """Insert many documents with timestamps in one round trip.
+
+    Returns (inserted ids, indexes of items that failed); with an unordered
+    insert the rest of the batch is still written when some items fail.
+    """
+    if db is None:
+        raise Exception("Database not available. Check DATABASE_URL and DATABASE_NAME environment variables.")
+    if not items:
+        return [], []
+
+    now = datetime.now(timezone.utc)
+    docs = []
+    for item in items:
+        doc = item.model_dump(exclude_none=True) if isinstance(item, BaseModel) else item.copy()
+        doc['created_at'] = now
+        doc['updated_at'] = now
+        docs.append(doc)
+
+    failed = set()
+    try:
+        await _write_collection(collection_name).insert_many(docs, ordered=False)
+    except BulkWriteError as e:
+        failed = {err['index'] for err in e.details.get('writeErrors', [])}
+    # insert_many assigns _id to every doc before sending
+    inserted_ids = [str(doc['_id']) for i, doc in enumerate(docs) if i not in failed]
+    return inserted_ids, sorted(failed)
+
+async def get_documents(collection_name: str, filter_dict: dict = None, limit: int = None, projection: dict = None):
+    """Get documents from collection, optionally limited to the projected fields"""
     if db is None:
         raise Exception("Database not available. Check DATABASE_URL and DATABASE_NAME environment variables.")
     
-    cursor = db[collection_name].find(filter_dict or {})
+    cursor = db[collection_name].find(filter_dict or {}, projection)
     if limit:
         cursor = cursor.limit(limit)
     
-    return list(cursor)
+    docs = await cursor.to_list(length=None)
+    # orjson can't encode ObjectId; stringify it up front
+    for doc in docs:
+        if '_id' in doc:
+            doc['_id'] = str(doc['_id'])
+    return docs
+
+def stream_documents(collection_name: str, filter_dict: dict = None, projection: dict = None):
+    """Stream documents from collection as JSON array chunks"""
+    if db is None:
+        raise Exception("Database not available. Check DATABASE_URL and DATABASE_NAME environment variables.")
+
+    cursor = db[collection_name].find(filter_dict or {}, projection)
+    return _json_array(cursor)
+
+async def _json_array(cursor):
+    yield b'['
+    first = True
+    async for doc in cursor:
+        if '_id' in doc:
+            doc['_id'] = str(doc['_id'])
+        yield (b'' if first else b',') + orjson.dumps(doc)
+        first = False
+    yield b']'
@@ -1,148 +1,317 @@
+import asyncio
+import logging
 import os
+import time
 from datetime import datetime
-from fastapi import FastAPI, HTTPException
+from fastapi import Body, Depends, FastAPI, HTTPException, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
+from fastapi.responses import ORJSONResponse, StreamingResponse
+import msgspec
 from typing import List, Optional
-
-from database import db, create_document, get_documents
+from bson import ObjectId
+from bson.errors import InvalidId
+from pymongo import ReturnDocument
+from pymongo.errors import PyMongoError
+
+import cache
+import database
+from database import create_document, create_documents, get_documents, stream_documents
 from schemas import (
     Client, Measurement, Session, WorkoutLog, NutritionEntry,
     Payment, ConsentTemplate, SignedConsent, RelativeStrengthResponse
 )
 
-app = FastAPI(title="MIND X MUSCLE API")
+logger = logging.getLogger(__name__)
+
+app = FastAPI(title="MIND X MUSCLE API", default_response_class=ORJSONResponse)
+
+# FRONTEND_URL may list several origins, comma-separated; "*" when unset
+allowed_origins = [o.strip() for o in os.getenv("FRONTEND_URL", "").split(",") if o.strip()] or ["*"]
 
 app.add_middleware(
     CORSMiddleware,
-    allow_origins=["*"],
+    allow_origins=allowed_origins,
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    max_age=86400,
 )
 
-@app.get("/")
-def read_root():
-    return {"message": "MIND X MUSCLE Backend Running"}
+WARMUP_TIMEOUT_SECONDS = 5
+
+async def warm_up(db):
+    # opens the first pooled connections before traffic arrives
+    await db.command("ping")
+    await database.ensure_indexes()
+
+@app.on_event("startup")
+async def startup():
+    app.state.db = database.connect()
+    cache.connect()
+    if app.state.db is not None:
+        try:
+            # bounded so an unreachable Mongo doesn't hold every worker's
+            # startup for the 30s server selection timeout
+            await asyncio.wait_for(warm_up(app.state.db), timeout=WARMUP_TIMEOUT_SECONDS)
+        except (PyMongoError, asyncio.TimeoutError) as e:
+            logger.warning("Database warm-up failed: %r", e)
+
+@app.on_event("shutdown")
+async def shutdown():
+    database.close()
+    await cache.close()
+
+async def cached_documents(key: str, collection_name: str, filter_dict: dict, projection: dict = None):
+    """Serve a list query from Redis, falling back to Mongo on a miss"""
+    payload, generation = await cache.get_cached(key)
+    if payload is None:
+        docs = await get_documents(collection_name, filter_dict, projection=projection)
+        payload = await cache.set_cached(key, docs, generation)
+    return Response(content=payload, media_type="application/json")
+
+async def streamed_documents(key: str, collection_name: str, filter_dict: dict):
+    """Like cached_documents, but streams straight off the cursor on a miss"""
+    payload, generation = await cache.get_cached(key)
+    if payload is not None:
+        return Response(content=payload, media_type="application/json")
+    chunks = stream_documents(collection_name, filter_dict)
+    if not cache.enabled():
+        return StreamingResponse(chunks, media_type="application/json")
+
+    async def body():
+        # buffer a copy for the cache only while it stays under the size cap
+        seen, size = [], 0
+        async for chunk in chunks:
+            if seen is not None:
+                size += len(chunk)
+                if size > cache.CACHE_MAX_PAYLOAD_BYTES:
+                    seen = None
+                else:
+                    seen.append(chunk)
+            yield chunk
+        if seen is not None:
+            # skipped if a write invalidated key while the client was downloading
+            await cache.set_payload(key, b"".join(seen), generation)
+
+    return StreamingResponse(body(), media_type="application/json")
+
+# Upper bound on entries per bulk ingest request
+BULK_MAX_ITEMS = 500
+
+def bulk_response(inserted_ids: List[str], failed: List[int]):
+    """Ids that were inserted, plus input indexes that failed (207 when any did)"""
+    return ORJSONResponse({"ids": inserted_ids, "failed": failed}, status_code=207 if failed else 200)
+
+async def decode_body(request: Request, type_):
+    """Decode a JSON request body straight into a msgspec Struct"""
+    try:
+        # strict=False keeps the lax coercion the Pydantic models had ("100" -> 100.0)
+        return msgspec.json.decode(await request.body(), type=type_, strict=False)
+    except msgspec.DecodeError as e:
+        raise HTTPException(status_code=422, detail=str(e))
 
-# --- EPIC 1: Client Profile & Measurements ---
+async def session_oid(session_id: str) -> ObjectId:
+    """Parse the session_id path param once, rejecting malformed ids before any DB work"""
+    try:
+        return ObjectId(session_id)
+    except InvalidId:
+        raise HTTPException(status_code=400, detail="Invalid session id")
+
+async def valid_client_id(client_id: str) -> str:
+    """Reject malformed client_id path params before any cache or DB work"""
+    if not ObjectId.is_valid(client_id):
+        raise HTTPException(status_code=400, detail="Invalid client id")
+    return client_id
+
+# (ordinal day, "YYYY-MM-DD") for the last UTC day formatted
+_day_cache = [0, ""]
+
+def today_utc(now: datetime) -> str:
+    """YYYY-MM-DD for a UTC datetime, formatted once per day"""
+    d = now.toordinal()
+    if d != _day_cache[0]:
+        _day_cache[:] = [d, f"{now.year:04d}-{now.month:02d}-{now.day:02d}"]
+    return _day_cache[1]
 
-@app.post("/clients", response_model=dict)
-def create_client(client: Client):
-    inserted_id = create_document("client", client)
-    return {"id": inserted_id}
+@app.get("/")
+async def read_root():
+    return ORJSONResponse({"message": "MIND X MUSCLE Backend Running"})
 
-@app.get("/clients", response_model=List[dict])
-def list_clients():
-    return get_documents("client")
+# --- EPIC 1: Client Profile & Measurements ---
 
-@app.post("/measurements", response_model=dict)
-def add_measurement(measurement: Measurement):
-    inserted_id = create_document("measurement", measurement)
-    return {"id": inserted_id}
+@app.post("/clients")
+async def create_client(client: Client):
+    inserted_id = await create_document("client", client)
+    return ORJSONResponse({"id": inserted_id})
+
+@app.get("/clients")
+async def list_clients():
+    return ORJSONResponse(await get_documents("client"))
+
+@app.post("/measurements")
+async def add_measurement(measurement: Measurement):
+    inserted_id = await create_document("measurement", measurement)
+    await cache.invalidate(
+        cache.client_key("measurement", measurement.client_id),
+        cache.client_key("measurement", measurement.client_id, "progress"),
+    )
+    return ORJSONResponse({"id": inserted_id})
+
+@app.post("/measurements/bulk")
+async def add_measurements_bulk(measurements: List[Measurement] = Body(max_length=BULK_MAX_ITEMS)):
+    inserted_ids, failed = await create_documents("measurement", measurements)
+    client_ids = {m.client_id for m in measurements}
+    await cache.invalidate(
+        *(cache.client_key("measurement", c) for c in client_ids),
+        *(cache.client_key("measurement", c, "progress") for c in client_ids),
+    )
+    return bulk_response(inserted_ids, failed)
 
-@app.get("/clients/{client_id}/measurements", response_model=List[dict])
-def get_client_measurements(client_id: str):
-    return get_documents("measurement", {"client_id": client_id})
+@app.get("/clients/{client_id}/measurements")
+async def get_client_measurements(client_id: str = Depends(valid_client_id)):
+    key = cache.client_key("measurement", client_id)
+    return await streamed_documents(key, "measurement", {"client_id": client_id})
 
-class OneRMRequest(BaseModel):
+class OneRMRequest(msgspec.Struct):
     one_rm_kg: float
     bodyweight_kg: float
     date: Optional[str] = None
 
-@app.post("/relative-strength", response_model=RelativeStrengthResponse)
-def relative_strength(data: OneRMRequest):
+@app.post("/relative-strength")
+async def relative_strength(request: Request) -> Response:
+    data = await decode_body(request, OneRMRequest)
     if data.bodyweight_kg <= 0:
         raise HTTPException(status_code=400, detail="Bodyweight must be > 0")
     rs = data.one_rm_kg / data.bodyweight_kg
-    return RelativeStrengthResponse(
+    result = RelativeStrengthResponse(
         client_id="",
         date=data.date,
         one_rm_kg=data.one_rm_kg,
         bodyweight_kg=data.bodyweight_kg,
         relative_strength=round(rs, 3)
     )
+    return Response(content=msgspec.json.encode(result), media_type="application/json")
 
 # --- EPIC 2: Sessions & Scheduling ---
 
-@app.post("/sessions", response_model=dict)
-def book_session(session: Session):
-    inserted_id = create_document("session", session)
-    return {"id": inserted_id}
+@app.post("/sessions")
+async def book_session(session: Session):
+    inserted_id = await create_document("session", session)
+    await cache.invalidate(cache.client_key("session", session.client_id))
+    return ORJSONResponse({"id": inserted_id})
 
-@app.get("/clients/{client_id}/sessions", response_model=List[dict])
-def get_client_sessions(client_id: str):
-    return get_documents("session", {"client_id": client_id})
+@app.get("/clients/{client_id}/sessions")
+async def get_client_sessions(client_id: str = Depends(valid_client_id)):
+    key = cache.client_key("session", client_id)
+    return await cached_documents(key, "session", {"client_id": client_id})
 
 # Attendance tracking: decrement sessions_remaining when completed
-class AttendanceUpdate(BaseModel):
+class AttendanceUpdate(msgspec.Struct):
     status: str  # completed/missed/cancelled
 
 @app.post("/sessions/{session_id}/attendance")
-def update_attendance(session_id: str, payload: AttendanceUpdate):
+async def update_attendance(request: Request, oid: ObjectId = Depends(session_oid)):
+    payload = await decode_body(request, AttendanceUpdate)
+    db = request.app.state.db
     if db is None:
         raise HTTPException(status_code=500, detail="Database not available")
-    from bson import ObjectId
+    now = datetime.utcnow()
     try:
-        sess = db["session"].find_one({"_id": ObjectId(session_id)})
+        # lookup + status update in a single round trip; the previous
+        # status tells us whether this session was already counted
+        sess = await db["session"].find_one_and_update(
+            {"_id": oid},
+            {"$set": {"status": payload.status, "updated_at": now}},
+            projection={"client_id": 1, "status": 1},
+            return_document=ReturnDocument.BEFORE,
+        )
         if not sess:
             raise HTTPException(status_code=404, detail="Session not found")
-        # update status
-        db["session"].update_one({"_id": ObjectId(session_id)}, {"$set": {"status": payload.status, "updated_at": datetime.utcnow()}})
         # decrement client sessions on completed
-        if payload.status == "completed":
-            db["client"].update_one({"_id": ObjectId(sess["client_id"])}, {"$inc": {"sessions_remaining": -1}, "$set": {"updated_at": datetime.utcnow()}})
-        return {"ok": True}
+        if payload.status == "completed" and sess.get("status") != "completed":
+            # only decrement a tracked, positive balance: a client stored without
+            # sessions_remaining must not end up at -1
+            await db["client"].update_one(
+                {"_id": ObjectId(sess["client_id"]), "sessions_remaining": {"$gt": 0}},
+                {"$inc": {"sessions_remaining": -1}, "$set": {"updated_at": now}},
+            )
+        await cache.invalidate(cache.client_key("session", sess["client_id"]))
+        return ORJSONResponse({"ok": True})
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
 # --- EPIC 3: Workouts & Programs ---
 
-@app.post("/workouts/log", response_model=dict)
-def log_workout(entry: WorkoutLog):
-    inserted_id = create_document("workoutlog", entry)
-    return {"id": inserted_id}
+@app.post("/workouts/log")
+async def log_workout(entry: WorkoutLog):
+    inserted_id = await create_document("workoutlog", entry)
+    await cache.invalidate(cache.client_key("workoutlog", entry.client_id))
+    return ORJSONResponse({"id": inserted_id})
+
+@app.post("/workouts/bulk")
+async def log_workouts_bulk(entries: List[WorkoutLog] = Body(max_length=BULK_MAX_ITEMS)):
+    inserted_ids, failed = await create_documents("workoutlog", entries)
+    await cache.invalidate(*{cache.client_key("workoutlog", e.client_id) for e in entries})
+    return bulk_response(inserted_ids, failed)
 
-@app.get("/clients/{client_id}/workouts", response_model=List[dict])
-def get_workouts(client_id: str):
-    return get_documents("workoutlog", {"client_id": client_id})
+@app.get("/clients/{client_id}/workouts")
+async def get_workouts(client_id: str = Depends(valid_client_id)):
+    key = cache.client_key("workoutlog", client_id)
+    return await streamed_documents(key, "workoutlog", {"client_id": client_id})
 
 # --- EPIC 4: Nutrition & Calorie Tracking ---
 
-@app.post("/nutrition", response_model=dict)
-def add_nutrition(entry: NutritionEntry):
-    inserted_id = create_document("nutritionentry", entry)
-    return {"id": inserted_id}
+@app.post("/nutrition")
+async def add_nutrition(entry: NutritionEntry):
+    inserted_id = await create_document("nutritionentry", entry)
+    await cache.invalidate(cache.client_key("nutritionentry", entry.client_id))
+    return ORJSONResponse({"id": inserted_id})
 
-@app.get("/clients/{client_id}/nutrition", response_model=List[dict])
-def get_nutrition(client_id: str):
-    return get_documents("nutritionentry", {"client_id": client_id})
+@app.post("/nutrition/bulk")
+async def add_nutrition_bulk(entries: List[NutritionEntry] = Body(max_length=BULK_MAX_ITEMS)):
+    inserted_ids, failed = await create_documents("nutritionentry", entries)
+    await cache.invalidate(*{cache.client_key("nutritionentry", e.client_id) for e in entries})
+    return bulk_response(inserted_ids, failed)
+
+@app.get("/clients/{client_id}/nutrition")
+async def get_nutrition(client_id: str = Depends(valid_client_id)):
+    key = cache.client_key("nutritionentry", client_id)
+    return await streamed_documents(key, "nutritionentry", {"client_id": client_id})
 
 # --- EPIC 5: Progress Tracking & Reporting ---
 
-@app.get("/clients/{client_id}/progress/relative-strength", response_model=List[dict])
-def progress_relative_strength(client_id: str):
-    return get_documents("measurement", {"client_id": client_id, "one_rm_kg": {"$gt": 0}, "bodyweight_kg": {"$gt": 0}})
+@app.get("/clients/{client_id}/progress/relative-strength")
+async def progress_relative_strength(client_id: str = Depends(valid_client_id)):
+    key = cache.client_key("measurement", client_id, "progress")
+    return await cached_documents(
+        key, "measurement",
+        {"client_id": client_id, "one_rm_kg": {"$gt": 0}, "bodyweight_kg": {"$gt": 0}},
+        projection={"date": 1, "one_rm_kg": 1, "bodyweight_kg": 1, "_id": 0},
+    )
 
 # --- EPIC 6: Payments & Subscriptions ---
 
-@app.post("/payments", response_model=dict)
-def create_payment(p: Payment):
-    inserted_id = create_document("payment", p)
-    return {"id": inserted_id}
+@app.post("/payments")
+async def create_payment(p: Payment):
+    inserted_id = await create_document("payment", p)
+    await cache.invalidate(cache.client_key("payment", p.client_id))
+    return ORJSONResponse({"id": inserted_id})
 
-@app.get("/clients/{client_id}/payments", response_model=List[dict])
-def get_payments(client_id: str):
-    return get_documents("payment", {"client_id": client_id})
+@app.get("/clients/{client_id}/payments")
+async def get_payments(client_id: str = Depends(valid_client_id)):
+    key = cache.client_key("payment", client_id)
+    return await cached_documents(key, "payment", {"client_id": client_id})
 
 # --- EPIC 10: Digital Consent & Legal Forms ---
 
-@app.post("/consent/templates", response_model=dict)
-def upload_consent_template(t: ConsentTemplate):
-    inserted_id = create_document("consenttemplate", t)
-    return {"id": inserted_id}
+@app.post("/consent/templates")
+async def upload_consent_template(t: ConsentTemplate):
+    inserted_id = await create_document("consenttemplate", t)
+    return ORJSONResponse({"id": inserted_id})
 
-class SignConsentRequest(BaseModel):
+class SignConsentRequest(msgspec.Struct):
     client_id: str
     client_name: str
     template_id: str
@@ -151,10 +320,12 @@ class SignConsentRequest(BaseModel):
     signature_text: str
     media_consent: bool = True
 
-@app.post("/consent/sign", response_model=dict)
-def sign_consent(data: SignConsentRequest):
+@app.post("/consent/sign")
+async def sign_consent(request: Request):
+    data = await decode_body(request, SignConsentRequest)
     # Generate PDF-like filename
-    today = datetime.utcnow().strftime("%Y-%m-%d")
+    now = datetime.utcnow()
+    today = today_utc(now)
     filename = f"Consent_AswajithSS_{data.client_name}_{today}.pdf"
     signed = SignedConsent(
         client_id=data.client_id,
@@ -162,18 +333,37 @@ def sign_consent(data: SignConsentRequest):
         template_id=data.template_id,
         template_title=data.template_title,
         template_version=data.template_version,
-        signed_at=datetime.utcnow().isoformat(),
+        signed_at=now.isoformat(timespec="seconds"),
         signature_text=data.signature_text,
         media_consent=data.media_consent,
         pdf_filename=filename,
     )
-    inserted_id = create_document("signedconsent", signed)
-    return {"id": inserted_id, "pdf": filename}
+    inserted_id = await create_document("signedconsent", signed)
+    return ORJSONResponse({"id": inserted_id, "pdf": filename})
 
 # --- Utilities ---
 
+@app.get("/healthz")
+async def healthz(request: Request):
+    """Cheap liveness/readiness probe: a single ping, no admin commands"""
+    db = request.app.state.db
+    if db is None:
+        raise HTTPException(status_code=503, detail="Database not available")
+    try:
+        await db.command("ping")
+    except PyMongoError:
+        raise HTTPException(status_code=503, detail="Database not reachable")
+    return ORJSONResponse({"status": "ok"})
+
+DIAG_CACHE_SECONDS = 10
+_diag_cache = {"t": 0.0, "val": None}
+
 @app.get("/test")
-def test_database():
+@app.get("/diag")
+async def test_database(request: Request):
+    # list_collection_names is an admin command; don't repeat it on every hit
+    if _diag_cache["val"] is not None and time.monotonic() - _diag_cache["t"] < DIAG_CACHE_SECONDS:
+        return ORJSONResponse(_diag_cache["val"])
     response = {
         "backend": "✅ Running",
         "database": "❌ Not Available",
@@ -182,6 +372,7 @@ def test_database():
         "connection_status": "Not Connected",
         "collections": []
     }
+    db = request.app.state.db
     try:
         if db is not None:
             response["database"] = "✅ Available"
@@ -189,7 +380,7 @@ def test_database():
             response["database_name"] = db.name
             response["connection_status"] = "Connected"
             try:
-                response["collections"] = db.list_collection_names()[:10]
+                response["collections"] = (await db.list_collection_names())[:10]
                 response["database"] = "✅ Connected & Working"
             except Exception as e:
                 response["database"] = f"⚠️  Connected but Error: {str(e)[:50]}"
@@ -198,9 +389,12 @@ def test_database():
 
     response["database_url"] = "✅ Set" if os.getenv("DATABASE_URL") else "❌ Not Set"
     response["database_name"] = "✅ Set" if os.getenv("DATABASE_NAME") else "❌ Not Set"
-    return response
+    _diag_cache["t"] = time.monotonic()
+    _diag_cache["val"] = response
+    return ORJSONResponse(response)
 
 if __name__ == "__main__":
     import uvicorn
     port = int(os.getenv("PORT", 8000))
-    uvicorn.run(app, host="0.0.0.0", port=port)
+    workers = int(os.getenv("WEB_CONCURRENCY", (os.cpu_count() or 1) * 2 + 1))
+    uvicorn.run("main:app", host="0.0.0.0", port=port, workers=workers, loop="uvloop", http="httptools")
@@ -5,9 +5,20 @@ Each Pydantic model represents a collection in MongoDB.
 Collection name is the lowercase of the class name.
 """
 
-from pydantic import BaseModel, Field
-from typing import Optional, List, Literal
+import msgspec
+from pydantic import AfterValidator, BaseModel, Field
+from typing import Annotated, Optional, List, Literal
 from datetime import datetime
+from bson import ObjectId
+
+def _check_object_id(v: str) -> str:
+    if not ObjectId.is_valid(v):
+        raise ValueError("must be a 24-character hex ObjectId")
+    return v
+
+# client_id as stored on per-client documents; the GET /clients/{client_id}/*
+# endpoints reject anything else, so writes must too
+ClientId = Annotated[str, AfterValidator(_check_object_id)]
 
 # Core domain schemas
 
@@ -27,7 +38,7 @@ class Client(BaseModel):
     is_active: bool = Field(True)
 
 class Measurement(BaseModel):
-    client_id: str = Field(..., description="Reference to Client _id as string")
+    client_id: ClientId = Field(..., description="Reference to Client _id as string")
     date: Optional[str] = Field(None, description="YYYY-MM-DD")
     weight_kg: Optional[float] = Field(None, ge=20, le=400)
     bodyfat_pct: Optional[float] = Field(None, ge=0, le=100)
@@ -41,7 +52,7 @@ class Measurement(BaseModel):
     bodyweight_kg: Optional[float] = Field(None, ge=0)
 
 class Session(BaseModel):
-    client_id: str
+    client_id: ClientId
     start_time: str = Field(..., description="ISO datetime")
     end_time: str = Field(..., description="ISO datetime")
     status: Literal["scheduled", "completed", "missed", "cancelled"] = "scheduled"
@@ -51,7 +62,7 @@ class Session(BaseModel):
     is_frozen: bool = False
 
 class WorkoutLog(BaseModel):
-    client_id: str
+    client_id: ClientId
     date: str = Field(..., description="YYYY-MM-DD")
     exercise: str
     sets: int
@@ -61,7 +72,7 @@ class WorkoutLog(BaseModel):
     source: Literal["session", "home"] = "session"
 
 class NutritionEntry(BaseModel):
-    client_id: str
+    client_id: ClientId
     date: str = Field(..., description="YYYY-MM-DD")
     meal: Literal["breakfast", "lunch", "dinner", "snack"]
     item: str
@@ -71,7 +82,7 @@ class NutritionEntry(BaseModel):
     fats_g: Optional[float] = Field(None, ge=0)
 
 class Payment(BaseModel):
-    client_id: str
+    client_id: ClientId
     package_name: str
     amount: float = Field(..., ge=0)
     currency: str = "INR"
@@ -97,8 +108,9 @@ class SignedConsent(BaseModel):
     pdf_filename: Optional[str] = None
 
 # Utility response models (not collections)
+# msgspec Structs: encoded directly in the handler, never validated by FastAPI
 
-class RelativeStrengthResponse(BaseModel):
+class RelativeStrengthResponse(msgspec.Struct, kw_only=True):
     client_id: str
     date: Optional[str] = None
     one_rm_kg: float